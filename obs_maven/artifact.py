@@ -13,7 +13,6 @@
 #
 # You should have received a copy of the GNU General Public License
 
-from datetime import datetime
 import errno
 import hashlib
 import logging
@@ -22,8 +21,46 @@ import os.path
 import re
 import shutil
 import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
 
+from obs_maven.header import RpmHeader
+import obs_maven.metadata
+
+
+class Result:
+    """
+    Outcome of the processing of an artifact for an output repository
+    """
+
+    RESOLVED = "resolved"
+    SKIPPED = "skipped"
+    PENDING = "pending"
+    DEPLOYED = "deployed"
+    FAILED = "failed"
+
+    def __init__(self, artifact, repo, rpm, status, error=None):
+        self.artifact = artifact
+        self.repo = repo
+        self.rpm = rpm
+        self.status = status
+        # Exception explaining a FAILED status
+        self.error = error
+        # (jar entry, not linked files, version) once resolved from the package header
+        self.resolution = None
+        # Set once deployed
+        self.group = None
+        self.version = None
+        self.path = None
+
+    def __str__(self):
+        return "<Result {} in {}: {}>".format(self.artifact.artifact, self.repo, self.status)
+
+    def fail(self, error):
+        logging.error("Failed to process artifact %s: %s" % (self.artifact.artifact, error))
+        self.status = Result.FAILED
+        self.error = error
+
 
 class Artifact:
     def __init__(self, config, repositories, group):
@@ -44,7 +81,7 @@ class Artifact:
         excluded = ["javadoc", "examples", "manual", "test", "demo"]
         filtered = [
             file
-            for file in self.repository.rpms
+            for file in self.repository.find_rpms(Artifact.get_name_prefix(file_pattern))
             if not bool([pattern for pattern in excluded if pattern in file.name]) and re.match(file_pattern, file.name)
         ]
 
@@ -60,6 +97,9 @@ class Artifact:
         return filtered[0]
 
     def fetch_binary(self, file, tmp):
+        if self.repository.cache_rpms:
+            logging.info("Getting %s" % file.name)
+            return self.repository.get_cached_binary(file.path, file.mtime)
         target_file = os.path.join(tmp, file.name)
         logging.info("Downloading %s" % target_file)
         self.repository.get_binary(file.path, target_file, file.mtime)
@@ -67,21 +107,16 @@ class Artifact:
             return target_file
         return None
 
-    def extract(self, rpm_file, tmp, parse_pom):
-        # Get the rpm tags
-        rpm_process = subprocess.Popen(["rpm", "-q", "--xml", "-p", rpm_file], stdout=subprocess.PIPE)
-        rpm_tags = ET.fromstring(rpm_process.communicate()[0])
-
-        # Get the file links list and package version
-        links = [node.text for node in rpm_tags.findall('.//rpmTag[@name="Filelinktos"]/*')]
-        # Extract the version declared by the RPM
-        rpm_version = rpm_tags.find(".//rpmTag[@name='Version']/").text
-
-        # Get the files
-        rpm_process = subprocess.Popen(["rpm", "-qlp", rpm_file], stdout=subprocess.PIPE)
-        files = rpm_process.communicate()[0].splitlines()
+    def fetch_header(self, file):
+        if file.header_range is None:
+            logging.debug("No header range available for %s" % file.name)
+            return None
+        logging.info("Downloading header of %s" % file.name)
+        return RpmHeader(self.repository.get_header(file.path, file.header_range))
 
-        not_linked = [f.decode("utf-8") for (i, f) in enumerate(files) if links[i] is None]
+    def resolve(self, header, rpm_name):
+        # Get the files not being links
+        not_linked = [f for (f, link) in zip(header.files, header.links) if not link]
         logging.debug("not linked:\n  %s" % "\n  ".join(not_linked))
 
         pattern = self.jar if self.jar is not None else self.artifact
@@ -91,14 +126,14 @@ class Artifact:
 
         jars = [f for f in not_linked if re.match("^/usr/.*/{}".format(end_pattern), f)]
         if len(jars) == 0:
-            raise RuntimeError("Found no jar to extract in " + rpm_file)
+            raise RuntimeError("Found no jar to extract in " + rpm_name)
         elif len(jars) > 1:
             to_extract = [f for f in jars if re.match(full_pattern, f)]
             if len(to_extract) == 0:
-                raise RuntimeError("Found no jar matching {} in {}".format(pattern, rpm_file))
+                raise RuntimeError("Found no jar matching {} in {}".format(pattern, rpm_name))
             elif len(to_extract) > 1:
                 raise RuntimeError(
-                    "Found several jars to extract in {}:\n  {}".format(rpm_file, "\n  ".join(to_extract))
+                    "Found several jars to extract in {}:\n  {}".format(rpm_name, "\n  ".join(to_extract))
                 )
             jar_entry = to_extract[0]
         else:
@@ -111,22 +146,10 @@ class Artifact:
         else:
             jar_version = None
 
-        # If specified, extract the pom and parse the data
-        if parse_pom:
-            (pom_group, pom_version) = self.parse_pom_information(rpm_file, not_linked, tmp)
-        else:
-            (pom_group, pom_version) = (None, None)
-
-        # Extract the jar file from the RPM
-        dst_path = os.path.join(tmp, os.path.basename(jar_entry))
-        logging.info("extracting %s to %s" % (jar_entry, dst_path))
-        Artifact.extract_file_from_rpm(tmp, rpm_file, dst_path, jar_entry)
-
-        shutil.rmtree(os.path.join(tmp, "usr"))
+        # Fallback to the version declared by the RPM
+        return jar_entry, not_linked, jar_version or header.version
 
-        return dst_path, pom_group or self.default_group, pom_version or jar_version or rpm_version
-
-    def parse_pom_information(self, rpm_file, file_list, tmp):
+    def find_poms(self, file_list):
         # First check for a file named <artifact>.pom
         logging.debug("Searching pom for artifact %s" % self.artifact)
         poms = [f for f in file_list if re.match("^/usr/share/maven-poms/.*{}.pom".format(self.artifact), f)]
@@ -134,19 +157,19 @@ class Artifact:
             # If no result, fallback to parse all available poms
             logging.debug("No direct pom file found. Searching all poms available")
             poms = [f for f in file_list if re.match("^/usr/share/maven-poms/.*.pom", f)]
+        return poms
 
+    def parse_pom_information(self, poms, extract_dir):
         if len(poms) == 0:
             # Still no data available
             logging.debug("No pom available in the package")
             return None, None
 
         for pom_entry in poms:
-            pom_dst_path = os.path.join(tmp, os.path.basename(pom_entry))
             logging.debug("Processing pom available at %s" % pom_entry)
 
-            # Extract and parse the file
-            Artifact.extract_file_from_rpm(tmp, rpm_file, pom_dst_path, pom_entry)
-            pom_doc = ET.parse(pom_dst_path)
+            # Parse the already extracted file
+            pom_doc = ET.parse(os.path.join(extract_dir, "." + pom_entry))
             project_tag = pom_doc.getroot()
 
             # Identify if the pom.xml file uses namespace: we need to ajust the xpaths
@@ -172,6 +195,11 @@ class Artifact:
 
         return None, None
 
+    def get_jar_path(self, repo, group, version):
+        return os.path.join(
+            repo, Artifact.format_as_directory(group), self.artifact, version, "%s-%s.jar" % (self.artifact, version)
+        )
+
     def deploy(self, jar, group, version, repo, mtime):
         artifact_folder = os.path.join(repo, Artifact.format_as_directory(group), self.artifact)
         try:
@@ -181,9 +209,9 @@ class Artifact:
                 pass
             else:
                 raise
-        jar_path = os.path.join(artifact_folder, version, "%s-%s.jar" % (self.artifact, version))
+        jar_path = self.get_jar_path(repo, group, version)
         logging.info("deploying %s to %s" % (jar, jar_path))
-        shutil.copyfile(jar, jar_path)
+        Artifact.link_or_copy(jar, jar_path)
         logging.debug("Setting mtime %d on %s" % (mtime, jar_path))
         os.utime(jar_path, (mtime, mtime))
 
@@ -209,52 +237,28 @@ class Artifact:
         Artifact.compute_sha1_file(pom_path)
 
         # Maintain metadata file repo/group/artifact/maven-metadata-local.xml
-        metadata_path = os.path.join(artifact_folder, "maven-metadata-local.xml")
-        update_time = datetime.strftime(datetime.now(), "%Y%m%d%H%M%S")
-        write_anew = True
+        metadata_path = os.path.join(artifact_folder, obs_maven.metadata.METADATA_FILE)
+        versions = []
         if os.path.isfile(metadata_path):
-            doc = ET.parse(metadata_path)
-            versions_node = doc.find("versions")
-            lastupdated_node = doc.find("lastUpdated")
-            if versions_node is None or lastupdated_node is None:
+            versions = obs_maven.metadata.read_versions(metadata_path)
+            if versions is None:
                 logging.warning("Invalid XML file: creating a new one: %s" % metadata_path)
-            else:
-                version_node = ET.SubElement(versions_node, "version")
-                version_node.text = version
-                lastupdated_node.text = update_time
-                doc.write(metadata_path)
-                write_anew = False
-
-        # Something wrong happened or we don't have the file: create a fresh one
-        if write_anew:
-            xml = """<?xml version="1.0" encoding="UTF-8"?>
-<metadata xmlns="http://maven.apache.org/METADATA/1.1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-          xsi:schemaLocation="http://maven.apache.org/METADATA/1.1.0 https://maven.apache.org/xsd/repository-metadata-1.1.0.xsd">
-  <groupId>%s</groupId>
-  <artifactId>%s</artifactId>
-  <versioning>
-    <release>%s</release>
-    <versions>
-      <version>%s</version>
-    </versions>
-    <lastUpdated>%s</lastUpdated>
-  </versioning>
-</metadata>
-""" % (
-                group,
-                self.artifact,
-                version,
-                version,
-                update_time,
-            )
-            with open(metadata_path, "w") as fd:
-                fd.write(xml)
-
-    def process(self, repo, tmp, parse_pom):
-        logging.info("Processing artifact %s" % self.artifact)
-        file = self.get_binary()
-
-        if parse_pom:
+                versions = []
+
+        # The deployed version is the latest release
+        versions = [v for v in versions if v != version] + [version]
+        obs_maven.metadata.write(metadata_path, group, self.artifact, versions)
+        return jar_path
+
+    def is_deployed(self, repo, file, parse_pom, pom_info=None, jars=None):
+        if pom_info is not None:
+            # The pom of this package has already been parsed: no need to guess where it is deployed
+            (pom_group, pom_version) = pom_info
+            group = pom_group or self.default_group
+            if pom_version is not None:
+                return Artifact.has_mtime(self.get_jar_path(repo, group, pom_version), file.mtime)
+            artifact_prefix = "%s%s%s" % (os.path.sep, Artifact.format_as_directory(group), os.path.sep)
+        elif parse_pom:
             # If we rely on parsing the pom, we need to download the package to know the exact
             # groupId, hence the prefix for the artifact. This means we could potentially
             # skip an rpm if two different jars have the same artifact id, different groups
@@ -265,40 +269,216 @@ class Artifact:
             artifact_prefix = "%s%s%s" % (os.path.sep, self.default_group, os.path.sep)
 
         # Check if one of the artifact's jar has the same mtime. If so no need to update
+        if jars is None:
+            jars = Artifact.list_jars(repo)
         mtimes = [
-            y
-            for x in [
-                [os.stat(os.path.join(root, f)).st_mtime for f in files if f.endswith(".jar")]
-                for root, dirs, files in os.walk(repo)
-                if "%s%s%s" % (artifact_prefix, self.artifact, os.path.sep) in root
-            ]
-            for y in x
+            mtime
+            for root, root_mtimes in jars.items()
+            if "%s%s%s" % (artifact_prefix, self.artifact, os.path.sep) in root
+            for mtime in root_mtimes
         ]
 
-        if not [mtime for mtime in mtimes if file.mtime == int(mtime)]:
-            logging.debug("package mtime: %d, [%s]" % (file.mtime, ", ".join(["%f" % t for t in mtimes])))
-            rpm_file = self.fetch_binary(file, tmp)
-            if rpm_file is None:
-                raise RuntimeError("Failed to download " + file)
+        if [mtime for mtime in mtimes if file.mtime == int(mtime)]:
+            return True
+        logging.debug("package mtime: %d, [%s]" % (file.mtime, ", ".join(["%f" % t for t in mtimes])))
+        return False
 
-            # Find out the version
-            m = re.match(".*-([^-]+)-[^-]+.[^.]+.rpm", rpm_file)
-            if m is None:
-                raise RuntimeError("Failed to get version of " + rpm_file)
+    def process(self, repo, tmp, parse_pom, header_range=False, pom_cache=None):
+        return Artifact.process_all([self], repo, tmp, parse_pom, header_range, pom_cache)
 
-            # Extract the jar and pom
-            (jar, group, version) = self.extract(rpm_file, tmp, parse_pom)
+    @staticmethod
+    def process_all(artifacts, repo, tmp, parse_pom, header_range=False, pom_cache=None):
+        return Artifact.process_targets([(repo, artifacts)], tmp, parse_pom, header_range, pom_cache)
+
+    def plan(self, repo, file, parse_pom, pom_info, jars, get_header=None):
+        """
+        Get the status of the artifact deployment and the resolution of its jar from the package header.
+
+        get_header is only called for the artifacts not found in the deployed jars.
+        """
+        if self.is_deployed(repo, file, parse_pom, pom_info, jars):
+            return Result.SKIPPED, None
+
+        header = get_header() if get_header is not None else None
+        resolution = self.resolve(header, file.name) if header is not None else None
+        if resolution is not None and (pom_info is not None or not parse_pom):
+            # The exact jar path is known without downloading the package, even with a dotted group
+            (pom_group, pom_version) = pom_info or (None, None)
+            jar_path = self.get_jar_path(repo, pom_group or self.default_group, pom_version or resolution[2])
+            if Artifact.has_mtime(jar_path, file.mtime):
+                return Result.SKIPPED, resolution
+        return Result.PENDING, resolution
+
+    def get_package_key(self, file):
+        # The same path may point to different packages in different repositories
+        return file.checksum or self.repository.get_repo_path(file.path)
+
+    def get_header_getter(self, file, headers):
+        """
+        Get a function fetching the header of the package, only once for all the artifacts sharing it
+        """
+
+        def get_header():
+            key = self.get_package_key(file)
+            if key not in headers:
+                headers[key] = self.fetch_header(file)
+            return headers[key]
+
+        return get_header
 
-            # Install in the repository
-            self.deploy(jar, group, version, repo, file.mtime)
-        else:
-            logging.info("Skipping artifact %s" % self.artifact)
+    @staticmethod
+    def plan_targets(targets, parse_pom, pom_cache=None, index=None, header_range=False):
+        """
+        Find out which artifacts of the (repo, artifacts) targets need to be deployed.
+
+        index maps the repositories to their list_jars() value and is filled when needed.
+        With header_range, only the package headers are downloaded to resolve the jars and versions.
+        """
+        index = {} if index is None else index
+        headers = {}
+        results = []
+        for repo, artifacts in targets:
+            if repo not in index:
+                index[repo] = Artifact.list_jars(repo)
+            for artifact in artifacts:
+                logging.info("Processing artifact %s in %s" % (artifact.artifact, repo))
+                result = Result(artifact, repo, None, Result.PENDING)
+                results.append(result)
+                try:
+                    result.rpm = artifact.get_binary()
+                    pom_info = (
+                        pom_cache.get(result.rpm, artifact.artifact) if parse_pom and pom_cache is not None else None
+                    )
+                    (result.status, result.resolution) = artifact.plan(
+                        repo,
+                        result.rpm,
+                        parse_pom,
+                        pom_info,
+                        index[repo],
+                        artifact.get_header_getter(result.rpm, headers) if header_range else None,
+                    )
+                except Exception as e:
+                    result.fail(e)
+                    continue
+                if result.status == Result.SKIPPED:
+                    logging.info("Skipping artifact %s" % artifact.artifact)
+                elif result.resolution is not None:
+                    logging.info(
+                        "Resolved %s version %s from the header of %s"
+                        % (result.resolution[0], result.resolution[2], result.rpm.name)
+                    )
+        return results
 
     @staticmethod
-    def compute_sha1_file(file_name):
-        output_file_name = "{}.sha1".format(file_name)
-        logging.debug("Computing %s" % output_file_name)
+    def process_targets(targets, tmp, parse_pom, header_range=False, pom_cache=None, index=None):
+        """
+        Deploy the (repo, artifacts) targets, downloading and extracting each package only once
+        """
+        index = {} if index is None else index
+        results = Artifact.plan_targets(targets, parse_pom, pom_cache, index, header_range)
+        groups = {}
+        for result in results:
+            if result.status == Result.PENDING:
+                groups.setdefault(result.artifact.get_package_key(result.rpm), []).append(result)
+
+        for group_results in groups.values():
+            try:
+                Artifact.process_rpm(group_results, tmp, parse_pom, pom_cache)
+            except Exception as e:
+                # The package couldn't be downloaded or extracted: none of its artifacts can be deployed
+                for result in group_results:
+                    if result.status == Result.PENDING:
+                        result.fail(e)
+            # Keep the index up to date for the next plans
+            for result in group_results:
+                if result.status == Result.DEPLOYED:
+                    jars = index[result.repo].setdefault(os.path.dirname(result.path), [])
+                    jars.append(result.rpm.mtime)
+        return results
+
+    @staticmethod
+    def process_rpm(results, tmp, parse_pom, pom_cache=None):
+        file = results[0].rpm
+        artifacts = [result.artifact for result in results]
+        logging.debug(
+            "Processing %s for artifacts %s" % (file.name, ", ".join([artifact.artifact for artifact in artifacts]))
+        )
 
+        rpm_file = artifacts[0].fetch_binary(file, tmp)
+        if rpm_file is None:
+            raise RuntimeError("Failed to download " + file.name)
+
+        # Find out the version
+        m = re.match(".*-([^-]+)-[^-]+.[^.]+.rpm", rpm_file)
+        if m is None:
+            raise RuntimeError("Failed to get version of " + rpm_file)
+
+        # Collect all the jars and poms to extract from the payload
+        header = None
+        resolved = []
+        entries = set()
+        for result in results:
+            artifact = result.artifact
+            if result.resolution is None:
+                # Get the rpm tags, unless the jar was already resolved from the fetched header
+                if header is None:
+                    header = RpmHeader.from_file(rpm_file)
+                try:
+                    result.resolution = artifact.resolve(header, rpm_file)
+                except RuntimeError as e:
+                    result.fail(e)
+                    continue
+            (jar_entry, not_linked, version) = result.resolution
+            pom_info = pom_cache.get(file, artifact.artifact) if parse_pom and pom_cache is not None else None
+            poms = artifact.find_poms(not_linked) if parse_pom and pom_info is None else []
+            resolved.append((result, jar_entry, version, poms, pom_info))
+            entries.add(jar_entry)
+            entries.update(poms)
+
+        extract_dir = tempfile.mkdtemp(dir=tmp)
+        try:
+            if not resolved:
+                return
+            logging.info("extracting %s from %s" % (", ".join(sorted(entries)), rpm_file))
+            Artifact.extract_files_from_rpm(extract_dir, rpm_file, sorted(entries))
+
+            # Install each artifact in its repository, linking the jars deployed in several repositories.
+            # The jar mtime is the one of the package in each repository: only equal mtimes can share a file
+            deployed = {}
+            for result, jar_entry, version, poms, pom_info in resolved:
+                artifact = result.artifact
+                try:
+                    if pom_info is not None:
+                        (pom_group, pom_version) = pom_info
+                    elif parse_pom:
+                        (pom_group, pom_version) = artifact.parse_pom_information(poms, extract_dir)
+                        if pom_cache is not None:
+                            pom_cache.set(file, artifact.artifact, (pom_group, pom_version))
+                    else:
+                        (pom_group, pom_version) = (None, None)
+                    mtime = result.rpm.mtime
+                    jar = deployed.get((jar_entry, mtime))
+                    if jar is None:
+                        jar = os.path.join(extract_dir, "." + jar_entry)
+                        if [key for key in deployed if key[0] == jar_entry]:
+                            # The extracted jar is already linked with another mtime
+                            shutil.copyfile(jar, "%s.%d" % (jar, mtime))
+                            jar = "%s.%d" % (jar, mtime)
+                    result.group = pom_group or artifact.default_group
+                    result.version = pom_version or version
+                    result.path = artifact.deploy(jar, result.group, result.version, result.repo, mtime)
+                except (OSError, ET.ParseError) as e:
+                    result.fail(e)
+                    continue
+                result.status = Result.DEPLOYED
+                deployed[(jar_entry, mtime)] = result.path
+        finally:
+            shutil.rmtree(extract_dir)
+            if not artifacts[0].repository.cache_rpms:
+                os.remove(rpm_file)
+
+    @staticmethod
+    def compute_sha1(file_name):
         # Compute the sha1 of the specified file
         sha1_hasher = hashlib.sha1()
         with open(file_name, 'rb') as f:
@@ -307,27 +487,79 @@ class Artifact:
             while chunk:
                 sha1_hasher.update(chunk)
                 chunk = f.read(chunk_size)
+        return sha1_hasher.hexdigest()
 
-        sha1_hash = sha1_hasher.hexdigest()
+    @staticmethod
+    def compute_sha1_file(file_name):
+        output_file_name = "{}.sha1".format(file_name)
+        logging.debug("Computing %s" % output_file_name)
+
+        sha1_hash = Artifact.compute_sha1(file_name)
         with open(output_file_name, 'w') as file:
             file.write(sha1_hash)
 
     @staticmethod
-    def extract_file_from_rpm(tmp, rpm_file, dst_path, entry):
-        old_pwd = os.getcwd()
-        os.chdir(tmp)
+    def extract_files_from_rpm(extract_dir, rpm_file, entries):
         rpm2cpio = subprocess.Popen(("rpm2cpio", rpm_file), stdout=subprocess.PIPE)
-        dst = open(dst_path, "wb")
         cpio = subprocess.Popen(
-            ("cpio", "-id", "." + entry), stdin=rpm2cpio.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            ["cpio", "-id"] + ["." + entry for entry in entries],
+            cwd=extract_dir,
+            stdin=rpm2cpio.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
         )
-        ret = cpio.wait()
-        dst.close()
-        os.chdir(old_pwd)
-        if ret != 0:
-            raise RuntimeError("Failed to extract jar file {}: {}".format(entry, cpio.communicate()[1]))
+        rpm2cpio.stdout.close()
+        (_, err) = cpio.communicate()
+        rpm2cpio.wait()
+        if cpio.returncode != 0:
+            raise RuntimeError("Failed to extract files {}: {}".format(", ".join(entries), err))
+
+        missing = [entry for entry in entries if not os.path.isfile(os.path.join(extract_dir, "." + entry))]
+        if missing:
+            raise RuntimeError("Failed to extract files {} from {}".format(", ".join(missing), rpm_file))
 
-        shutil.copy(os.path.join(tmp, "." + entry), dst_path)
+    @staticmethod
+    def has_mtime(path, mtime):
+        return os.path.isfile(path) and int(os.stat(path).st_mtime) == mtime
+
+    @staticmethod
+    def list_jars(repo):
+        """
+        Get the mtimes of the jar files in each folder of the repository
+        """
+        jars = {}
+        for root, dirs, files in os.walk(repo):
+            mtimes = [os.stat(os.path.join(root, f)).st_mtime for f in files if f.endswith(".jar")]
+            if mtimes:
+                jars[root] = mtimes
+        return jars
+
+    @staticmethod
+    def link_or_copy(src, dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return
+        # Never write in place: the previous file may be linked in other repositories
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    @staticmethod
+    def get_name_prefix(file_pattern):
+        """
+        Get the literal start of the package names matching the file pattern
+        """
+        if "|" in file_pattern:
+            # Alternatives may start with anything
+            return ""
+        literal = re.match(r"[^.^$*+?{}\[\]\\|()]*", file_pattern).group(0)
+        if file_pattern[len(literal) : len(literal) + 1] in ["?", "*", "{"]:
+            # The quantifier may drop the last literal character
+            literal = literal[:-1]
+        # The package name ends at a dash in the file name: only the part before the first dash is safe to use
+        return literal.split("-", 1)[0]
 
     @staticmethod
     def format_as_directory(group):
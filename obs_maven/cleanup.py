@@ -0,0 +1,104 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+import logging
+import os
+import os.path
+import re
+import shutil
+import time
+
+import obs_maven.metadata
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value):
+    """
+    Convert a size like 500M or 2G into bytes
+    """
+    m = re.match(r"^\s*([0-9]+)\s*([KMGT]?)i?B?\s*$", value, re.IGNORECASE)
+    if m is None:
+        raise ValueError("Invalid size: " + value)
+    return int(m.group(1)) * SIZE_UNITS[m.group(2).upper()]
+
+
+def evict_cache(cache_path, budget):
+    """
+    Remove the least recently used cached primaries and RPMs until the cache fits in the budget.
+
+    Only the files in the repositories cache folders are considered, the files at the root
+    of the cache directory are kept.
+    """
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(cache_path):
+        if root == cache_path:
+            continue
+        for name in files:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+    logging.debug("Cache size: %d bytes, budget: %d bytes" % (total, budget))
+    freed = 0
+    for atime, size, path in sorted(entries):
+        if total - freed <= budget:
+            break
+        logging.info("Evicting %s from the cache" % path)
+        os.remove(path)
+        freed += size
+    return freed
+
+
+def apply_retention(repo, keep=None, max_age=None):
+    """
+    Remove the old versions of the deployed artifacts and update their metadata.
+
+    A version is kept if it is one of the keep latest ones or if its package is younger than
+    max_age seconds. The latest version of each artifact is always kept.
+    """
+    folders = obs_maven.metadata.scan(repo)
+    now = time.time()
+    removed = []
+    for path in folders:
+        versions = obs_maven.metadata.find_versions(folders, path)
+        if not versions:
+            continue
+
+        artifact = os.path.basename(path)
+        kept = []
+        for index, version in enumerate(reversed(versions)):
+            files = folders[os.path.join(path, version)][0]
+            mtime = files[obs_maven.metadata.get_version_file(files, artifact, version)][1] / 1e9
+            if (
+                index == 0
+                or (keep is not None and index < keep)
+                or (max_age is not None and now - mtime < max_age)
+                or (keep is None and max_age is None)
+            ):
+                kept.insert(0, version)
+            else:
+                version_path = os.path.join(path, version)
+                logging.info("Removing old version %s" % version_path)
+                shutil.rmtree(version_path)
+                removed.append(version_path)
+
+        if len(kept) != len(versions):
+            metadata_path = os.path.join(path, obs_maven.metadata.METADATA_FILE)
+            logging.info("Updating %s" % metadata_path)
+            obs_maven.metadata.write(metadata_path, obs_maven.metadata.get_group(repo, path), artifact, kept)
+    return removed
@@ -0,0 +1,77 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+import logging
+import os
+import os.path
+import yaml
+
+from obs_maven.artifact import Artifact
+from obs_maven.repo import Repo
+
+
+class Target:
+    def __init__(self, name, repo, artifacts):
+        self.name = name
+        self.repo = repo
+        self.artifacts = artifacts
+
+
+class Configuration:
+    def __init__(self, config_path, repo, cache_path, allowed_artifacts, cache_rpms=False):
+        data = {}
+        if os.path.isfile(config_path):
+            f = open(config_path, "r")
+            data = yaml.safe_load(f)
+            f.close()
+        self.url = data.get("url", "https://download.opensuse.org/repositories")
+        self.repo = repo
+        self.cache_path = cache_path
+        self.cache_rpms = cache_rpms
+        # Repositories by definition to share them between the targets
+        self._repos = {}
+
+        repositories = data.get("repositories", {})
+        repos = {name: self.get_repo(name, data) for name, data in repositories.items()}
+        group = data.get("group", "suse")
+        names = [artifact["artifact"] for artifact in data.get("artifacts", [])]
+        artifacts = [artifact for artifact in data.get("artifacts", []) if not allowed_artifacts or artifact["artifact"] in allowed_artifacts]
+
+        targets = data.get("targets", {})
+        if not targets:
+            self.artifacts = [Artifact(artifact, repos, group) for artifact in artifacts]
+            self.targets = [Target(None, repo, self.artifacts)]
+        else:
+            # Each target overrides repositories definitions and gets its own output repository
+            self.artifacts = []
+            self.targets = []
+            for name, target in targets.items():
+                unknown = [artifact for artifact in target.get("artifacts", []) if artifact not in names]
+                if unknown:
+                    raise RuntimeError("Missing artifact definition in target {}: {}".format(name, ", ".join(unknown)))
+                target_repos = dict(repos)
+                target_repos.update({repo_name: self.get_repo("{}-{}".format(name, repo_name), data) for repo_name, data in target.get("repositories", {}).items()})
+                target_artifacts = [
+                    Artifact(artifact, target_repos, target.get("group", group)) for artifact in artifacts if "artifacts" not in target or artifact["artifact"] in target["artifacts"]
+                ]
+                if not target_artifacts:
+                    logging.warning("No artifact to synchronize for target %s" % name)
+                self.targets.append(Target(name, os.path.join(repo, target.get("out", name)), target_artifacts))
+
+    def get_repo(self, name, data):
+        key = (data.get("url") or self.url, data.get("project"), data.get("repository"))
+        if key not in self._repos:
+            self._repos[key] = Repo(name, self.cache_path, self.url, data.get("project"), data.get("repository"), data.get("url"), self.cache_rpms)
+        return self._repos[key]
@@ -18,68 +18,21 @@
 import argparse
 import http.client
 import logging
-import os
-import os.path
-import shutil
 import sys
-import tempfile
 import urllib.request
-import yaml
-import xml.etree.ElementTree as ET
 
-from obs_maven.repo import Repo
-from obs_maven.artifact import Artifact
+from obs_maven import cleanup
+from obs_maven.artifact import Result
+from obs_maven.config import Configuration
+from obs_maven.server import MavenProxy, Server
+from obs_maven.session import Session
+from obs_maven.verify import Verifier
 from obs_maven._version import __version__
 
 logging.basicConfig(level=logging.INFO)
 
 
-class Configuration:
-    def __init__(self, config_path, repo, cache_path, allowed_artifacts):
-        data = {}
-        if os.path.isfile(config_path):
-            f = open(config_path, "r")
-            data = yaml.safe_load(f)
-            f.close()
-        self.url = data.get("url", "https://download.opensuse.org/repositories")
-        self.repo = repo
-        
-        repositories = data.get("repositories", {})
-        repos = {name: Repo(name, cache_path, self.url, data.get("project"), data.get("repository"), data.get("url")) for name, data in repositories.items()}
-
-        self.artifacts = [
-            Artifact(artifact, repos, data.get("group", "suse")) for artifact in data.get("artifacts", []) if not allowed_artifacts or artifact["artifact"] in allowed_artifacts
-        ]
-
-def main():
-    ret = 0
-    parser = argparse.ArgumentParser(
-        description="OBS to Maven repository synchronization tool",
-        conflict_handler="resolve",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
-
-    parser.add_argument("config", help="Path to the YAML configuration file")
-    parser.add_argument("out", help="Path to the output maven repository")
-
-    parser.add_argument(
-        "-p",
-        "--parse-pom",
-        help="Extract the group id and the version information from the pom contained in the package",
-        dest="parse_pom",
-        action='store_true',
-        default=False
-    )
-
-    parser.add_argument(
-        "-a",
-        "--artifact",
-        help="Process only the specified artifact(s). Can be repeated multiple times",
-        dest="allowed_artifacts",
-        action='append',
-        default=[]
-    )
-
+def add_common_arguments(parser):
     parser.add_argument(
         "-c",
         "--cache",
@@ -106,10 +59,9 @@ def main():
     )
 
 
-    args = parser.parse_args()
-
-    logging.getLogger().setLevel(args.loglevel)
-    if args.loglevel == logging.DEBUG:
+def setup_logging(loglevel):
+    logging.getLogger().setLevel(loglevel)
+    if loglevel == logging.DEBUG:
         # http.client.HTTPConnection.debuglevel is not respected by all Python versions
         if sys.version_info >= (3, 12):
             http.client.HTTPConnection.debuglevel = 1
@@ -120,18 +72,265 @@ def main():
             )
             urllib.request.install_opener(opener)
 
+
+def sync(argv):
+    ret = 0
+    parser = argparse.ArgumentParser(
+        description="OBS to Maven repository synchronization tool",
+        epilog="Other modes: %s. Run 'obs-to-maven <mode> --help' for their usage." % ", ".join(MODES),
+        conflict_handler="resolve",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument("config", help="Path to the YAML configuration file")
+    parser.add_argument("out", help="Path to the output maven repository")
+
+    parser.add_argument(
+        "-p",
+        "--parse-pom",
+        help="Extract the group id and the version information from the pom contained in the package",
+        dest="parse_pom",
+        action='store_true',
+        default=False
+    )
+
+    parser.add_argument(
+        "-r",
+        "--header-range",
+        help="Fetch only the RPM headers to resolve the jar and version before downloading the packages",
+        dest="header_range",
+        action='store_true',
+        default=False
+    )
+
+    parser.add_argument(
+        "-a",
+        "--artifact",
+        help="Process only the specified artifact(s). Can be repeated multiple times",
+        dest="allowed_artifacts",
+        action='append',
+        default=[]
+    )
+
+    parser.add_argument(
+        "-s",
+        "--cache-size",
+        help="Keep the downloaded RPMs in the cache and evict the least recently used files above this size, "
+        "like 500M or 2G",
+        dest="cache_size",
+        default=None,
+        type=cleanup.parse_size,
+    )
+
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_logging(args.loglevel)
+
     logging.debug("Reading configuration")
-    config = Configuration(args.config, args.out, args.cache, args.allowed_artifacts)
-    tmp = tempfile.mkdtemp(prefix="obsmvn-")
+    session = Session(
+        args.config,
+        args.out,
+        args.cache,
+        args.parse_pom,
+        args.header_range,
+        args.cache_size,
+        allowed_artifacts=args.allowed_artifacts,
+    )
     try:
-        for artifact in config.artifacts:
-            artifact.process(config.repo, tmp, args.parse_pom)
+        results = session.sync()
+        failed = [result for result in results if result.status == Result.FAILED]
+        if failed:
+            logging.error("Failed to process %d artifact(s)" % len(failed))
+            ret = 1
     except RuntimeError as e:
         logging.error(e)
         ret = 1
-    shutil.rmtree(tmp)
+    session.close()
     return ret
 
 
+def verify(argv):
+    parser = argparse.ArgumentParser(
+        prog="obs-to-maven verify",
+        description="Check the checksums and metadata of a generated maven repository",
+        conflict_handler="resolve",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument("out", help="Path to the maven repository to verify")
+
+    parser.add_argument(
+        "--repair",
+        help="Fix the problems: corrupted versions are removed to be deployed again by the next synchronization",
+        dest="repair",
+        action='store_true',
+        default=False
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of files to hash in parallel",
+        dest="jobs",
+        default=None,
+        type=int,
+    )
+
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_logging(args.loglevel)
+
+    report = Verifier(args.out, args.cache, args.jobs).run(args.repair)
+    return 1 if report.problems and not args.repair else 0
+
+
+def gc(argv):
+    parser = argparse.ArgumentParser(
+        prog="obs-to-maven gc",
+        description="Evict cached files and remove old versions from a generated maven repository",
+        conflict_handler="resolve",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument("out", nargs="?", help="Path to the maven repository to clean up")
+
+    parser.add_argument(
+        "-s",
+        "--cache-size",
+        help="Evict the least recently used cached files above this size, like 500M or 2G",
+        dest="cache_size",
+        default=None,
+        type=cleanup.parse_size,
+    )
+
+    parser.add_argument(
+        "-k",
+        "--keep",
+        help="Number of versions to keep for each artifact",
+        dest="keep",
+        default=None,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-m",
+        "--max-age",
+        help="Keep the versions with packages younger than this number of days",
+        dest="max_age",
+        default=None,
+        type=float,
+    )
+
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_logging(args.loglevel)
+
+    if args.cache_size is not None:
+        freed = cleanup.evict_cache(args.cache, args.cache_size)
+        logging.info("Freed %d bytes from the cache" % freed)
+
+    if args.out is not None and (args.keep is not None or args.max_age is not None):
+        max_age = args.max_age * 24 * 3600 if args.max_age is not None else None
+        removed = cleanup.apply_retention(args.out, args.keep, max_age)
+        logging.info("Removed %d old version(s)" % len(removed))
+    return 0
+
+
+def serve(argv):
+    parser = argparse.ArgumentParser(
+        prog="obs-to-maven serve",
+        description="Serve the configured artifacts as a maven repository, deploying them on their first request",
+        conflict_handler="resolve",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument("config", help="Path to the YAML configuration file")
+    parser.add_argument("out", help="Path to the output maven repository")
+
+    parser.add_argument(
+        "-p",
+        "--parse-pom",
+        help="Extract the group id and the version information from the pom contained in the package",
+        dest="parse_pom",
+        action='store_true',
+        default=False
+    )
+
+    parser.add_argument(
+        "-r",
+        "--header-range",
+        help="Fetch only the RPM headers to resolve the jar and version before downloading the packages",
+        dest="header_range",
+        action='store_true',
+        default=False
+    )
+
+    parser.add_argument(
+        "-s",
+        "--cache-size",
+        help="Keep the downloaded RPMs in the cache and evict the least recently used files above this size "
+        "when stopping, like 500M or 2G",
+        dest="cache_size",
+        default=None,
+        type=cleanup.parse_size,
+    )
+
+    parser.add_argument(
+        "--bind",
+        help="Address to listen on",
+        dest="bind",
+        default="127.0.0.1",
+    )
+
+    parser.add_argument(
+        "--port",
+        help="Port to listen on",
+        dest="port",
+        default=8080,
+        type=int,
+    )
+
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_logging(args.loglevel)
+
+    logging.debug("Reading configuration")
+    config = Configuration(args.config, args.out, args.cache, [], cache_rpms=args.cache_size is not None)
+    if [target for target in config.targets if target.name is not None]:
+        parser.error("the serve mode doesn't support the targets of %s" % args.config)
+    proxy = MavenProxy(config, args.out, args.cache, args.parse_pom, args.header_range)
+    try:
+        proxy.load()
+        server = Server((args.bind, args.port), proxy)
+        logging.info("Serving %s on http://%s:%d" % (args.out, args.bind, server.server_address[1]))
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+        if args.cache_size is not None:
+            cleanup.evict_cache(args.cache, args.cache_size)
+    return 0
+
+
+MODES = {
+    "verify": verify,
+    "gc": gc,
+    "serve": serve,
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in MODES:
+        return MODES[argv[0]](argv[1:])
+    return sync(argv)
+
+
 if __name__ == "__main__":
     sys.exit(main())
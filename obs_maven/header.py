@@ -0,0 +1,105 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+import struct
+
+HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+LEAD_SIZE = 96
+
+# Tags of the main header we are interested in
+TAG_VERSION = 1001
+TAG_OLDFILENAMES = 1027
+TAG_FILELINKTOS = 1036
+TAG_DIRINDEXES = 1116
+TAG_BASENAMES = 1117
+TAG_DIRNAMES = 1118
+
+# Tag data types
+TYPE_INT32 = 4
+TYPE_STRING = 6
+TYPE_STRING_ARRAY = 8
+TYPE_I18NSTRING = 9
+
+
+class RpmHeader:
+    """
+    Minimal in-process parser of the main RPM header.
+
+    Only the tags needed to locate the jar and pom files and to get the package version are decoded.
+    """
+
+    def __init__(self, data):
+        if data[:4] != HEADER_MAGIC:
+            raise RuntimeError("Invalid RPM header magic")
+        (nindex, hsize) = struct.unpack(">II", data[8:16])
+        store_start = 16 + nindex * 16
+        if len(data) < store_start + hsize:
+            raise RuntimeError("Truncated RPM header")
+        store = data[store_start : store_start + hsize]
+
+        self.tags = {}
+        for i in range(nindex):
+            (tag, tag_type, offset, count) = struct.unpack(">iIiI", data[16 + i * 16 : 32 + i * 16])
+            if tag_type == TYPE_INT32:
+                self.tags[tag] = list(struct.unpack(">%dI" % count, store[offset : offset + 4 * count]))
+            elif tag_type in [TYPE_STRING, TYPE_STRING_ARRAY, TYPE_I18NSTRING]:
+                values = []
+                for _ in range(count):
+                    end = store.index(b"\0", offset)
+                    values.append(store[offset:end].decode("utf-8", errors="replace"))
+                    offset = end + 1
+                self.tags[tag] = values[0] if tag_type == TYPE_STRING else values
+
+    @staticmethod
+    def size(data):
+        """
+        Compute the size of the header starting data, based on its first 16 bytes.
+        """
+        if data[:4] != HEADER_MAGIC:
+            raise RuntimeError("Invalid RPM header magic")
+        (nindex, hsize) = struct.unpack(">II", data[8:16])
+        return 16 + nindex * 16 + hsize
+
+    @staticmethod
+    def from_file(rpm_file):
+        """
+        Read the main header of a downloaded RPM file, skipping the lead and signature header.
+        """
+        with open(rpm_file, "rb") as fd:
+            fd.seek(LEAD_SIZE)
+            signature_size = RpmHeader.size(fd.read(16))
+            # The signature header is padded to a multiple of 8 bytes
+            fd.seek(LEAD_SIZE + signature_size + (8 - signature_size % 8) % 8)
+            start = fd.read(16)
+            data = start + fd.read(RpmHeader.size(start) - 16)
+        return RpmHeader(data)
+
+    @property
+    def version(self):
+        return self.tags.get(TAG_VERSION)
+
+    @property
+    def files(self):
+        if TAG_BASENAMES in self.tags:
+            dirnames = self.tags.get(TAG_DIRNAMES, [])
+            return [
+                dirnames[index] + basename
+                for (index, basename) in zip(self.tags.get(TAG_DIRINDEXES, []), self.tags[TAG_BASENAMES])
+            ]
+        return self.tags.get(TAG_OLDFILENAMES, [])
+
+    @property
+    def links(self):
+        return self.tags.get(TAG_FILELINKTOS, [""] * len(self.files))
@@ -0,0 +1,120 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+from datetime import datetime
+import os
+import os.path
+import xml.etree.ElementTree as ET
+
+METADATA_FILE = "maven-metadata-local.xml"
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_versions(path):
+    """
+    Get the versions listed in a maven-metadata-local.xml file, None if the file is invalid
+    """
+    try:
+        doc = ET.parse(path)
+    except (OSError, ET.ParseError):
+        return None
+    for node in doc.iter():
+        if _local_name(node.tag) == "versions":
+            return [version.text for version in node if _local_name(version.tag) == "version"]
+    return None
+
+
+def write(path, group, artifact, versions):
+    """
+    Write a maven-metadata-local.xml file listing the versions, the last one being the release
+    """
+    with open(path, "w") as fd:
+        fd.write(render(group, artifact, versions))
+
+
+def render(group, artifact, versions, last_updated=None):
+    update_time = datetime.strftime(last_updated or datetime.now(), "%Y%m%d%H%M%S")
+    xml = """<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://maven.apache.org/METADATA/1.1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+          xsi:schemaLocation="http://maven.apache.org/METADATA/1.1.0 https://maven.apache.org/xsd/repository-metadata-1.1.0.xsd">
+  <groupId>%s</groupId>
+  <artifactId>%s</artifactId>
+  <versioning>
+    <release>%s</release>
+    <versions>
+%s
+    </versions>
+    <lastUpdated>%s</lastUpdated>
+  </versioning>
+</metadata>
+""" % (
+        group,
+        artifact,
+        versions[-1],
+        "\n".join(["      <version>%s</version>" % version for version in versions]),
+        update_time,
+    )
+    return xml
+
+
+def scan(repo):
+    """
+    Walk the repository once, returning the files stats and sub folders of each folder
+    """
+    folders = {}
+    pending = [repo]
+    while pending:
+        path = pending.pop()
+        files = {}
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        folders[path] = (files, subdirs)
+    return folders
+
+
+def get_version_file(files, artifact, version):
+    for extension in [".jar", ".pom"]:
+        name = "%s-%s%s" % (artifact, version, extension)
+        if name in files:
+            return name
+    return None
+
+
+def find_versions(folders, path):
+    """
+    Get the versions deployed in an artifact folder, sorted by the mtime of their package
+    """
+    artifact = os.path.basename(path)
+    versions = []
+    for version in folders[path][1]:
+        files = folders[os.path.join(path, version)][0]
+        version_file = get_version_file(files, artifact, version)
+        if version_file:
+            versions.append((files[version_file][1], version))
+    return [version for _, version in sorted(versions)]
+
+
+def get_group(repo, path):
+    return os.path.relpath(os.path.dirname(path), repo).replace(os.path.sep, ".")
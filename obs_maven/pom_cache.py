@@ -0,0 +1,72 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+import logging
+import os
+import os.path
+import pickle
+import threading
+
+CACHE_FILE = "poms.data"
+
+
+class PomCache:
+    """
+    Persistent cache of the (groupId, version) parsed from the poms of the packages.
+
+    The values are keyed by the package checksum and the artifact name: an unchanged package
+    doesn't need to be downloaded to know where its artifacts are deployed.
+    """
+
+    def __init__(self, cache_path):
+        self.path = os.path.join(cache_path, CACHE_FILE)
+        self.lock = threading.Lock()
+        self.changed = False
+        self.entries = {}
+        try:
+            if os.path.exists(self.path):
+                logging.debug("Loading pom information from cache file: %s", self.path)
+                with open(self.path, "rb") as fd:
+                    self.entries = pickle.load(fd)
+        except (OSError, pickle.UnpicklingError) as error:
+            logging.warning("Error loading pom information from cache: %s", error)
+
+    def get(self, file, artifact):
+        if file.checksum is None:
+            return None
+        with self.lock:
+            return self.entries.get((file.checksum, artifact))
+
+    def set(self, file, artifact, pom_info):
+        if file.checksum is None:
+            return
+        with self.lock:
+            self.entries[(file.checksum, artifact)] = pom_info
+            self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                cache_dir = os.path.dirname(self.path)
+                if cache_dir and not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                with open(self.path, "wb") as fw:
+                    logging.debug("Caching pom information in file: %s", self.path)
+                    pickle.dump(self.entries, fw)
+                self.changed = False
+            except OSError as error:
+                logging.warning("Error caching the pom information: %s", error)
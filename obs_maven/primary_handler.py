@@ -20,7 +20,8 @@ import xml.sax
 import obs_maven.rpm
 
 COMMON_NS = "http://linux.duke.edu/metadata/common"
-SEARCHED_CHARS = ["arch", "name"]
+RPM_NS = "http://linux.duke.edu/metadata/rpm"
+SEARCHED_CHARS = ["arch", "name", "checksum"]
 
 
 class Handler(xml.sax.handler.ContentHandler):
@@ -53,6 +54,10 @@ class Handler(xml.sax.handler.ContentHandler):
                     self.package["/".join([name[1], attr_name])] = value
         elif self.package is not None and name[0] == COMMON_NS and name[1] in SEARCHED_CHARS:
             self.text = ""
+        elif self.package is not None and name == (RPM_NS, "header-range"):
+            for attr_name in ["start", "end"]:
+                if attr_name in attrs.getQNames():
+                    self.package["header-range/" + attr_name] = int(attrs.getValueByQName(attr_name))
 
     def characters(self, content):
         if self.text is not None:
@@ -70,6 +75,8 @@ class Handler(xml.sax.handler.ContentHandler):
                     self.package["version/epoch"],
                     self.package["version/ver"],
                     self.package["version/rel"],
+                    Handler.get_header_range(self.package),
+                    self.package.get("checksum"),
                 )
 
                 latest_rpm = self.rpms.get(pkg_name)
@@ -78,3 +85,9 @@ class Handler(xml.sax.handler.ContentHandler):
         elif self.package is not None and name[0] == COMMON_NS and name[1] in SEARCHED_CHARS:
             self.package[name[1]] = self.text
             self.text = None
+
+    @staticmethod
+    def get_header_range(package):
+        if "header-range/start" in package and "header-range/end" in package:
+            return package["header-range/start"], package["header-range/end"]
+        return None
@@ -13,14 +13,18 @@
 #
 # You should have received a copy of the GNU General Public License
 
+import bz2
 import gzip
 import logging
+import lzma
 import os
 import pickle
 import shutil
+import sqlite3
 import subprocess
 import time
 import tempfile
+import zlib
 import urllib.request
 import urllib.error
 import xml.sax
@@ -29,11 +33,19 @@ import xml.etree.ElementTree as ET
 from xml.sax.xmlreader import InputSource
 
 import obs_maven.primary_handler
+import obs_maven.rpm
+
+# Architectures of the packages to consider, like in the primary.xml parser
+ARCHS = ["x86_64", "noarch"]
+
+# Version of the pickled RPMs cache files, to increase when the Rpm attributes change
+CACHE_VERSION = 2
 
 
 class Repo:
-    def __init__(self, name, cache_path, base_url, project, repository, custom_url=None):
+    def __init__(self, name, cache_path, base_url, project, repository, custom_url=None, cache_rpms=False):
         self.cache_dir = os.path.join(cache_path, str(name))
+        self.cache_rpms = cache_rpms
         self.base_url = base_url
         self.custom_url = custom_url
         if not custom_url:
@@ -43,6 +55,8 @@ class Repo:
             else:
                 raise ValueError("Either 'project' and 'repository' or 'url' must be defined for the repository")
         self._rpms = None
+        self._db_path = None
+        self._db_tried = False
 
     def get_repo_path(self, path):
         if self.custom_url is not None:
@@ -50,14 +64,154 @@ class Repo:
         else:
             return "{}/{}/{}/{}".format(self.base_url, self.project, self.repository, path)
 
-    def find_primary(self):
+    def find_primary(self, data_type="primary"):
         ns = {"repo": "http://linux.duke.edu/metadata/repo", "rpm": "http://linux.duke.edu/metadata/rpm"}
         repomd_url = self.get_repo_path("repodata/repomd.xml")
         logging.debug("Parsing %s", repomd_url)
         f = urllib.request.urlopen(repomd_url)
         doc = ET.fromstring(f.read())
-        primary_href = doc.find("./repo:data[@type='primary']/repo:location", ns).get("href")
-        return self.get_repo_path(primary_href)
+        location = doc.find("./repo:data[@type='{}']/repo:location".format(data_type), ns)
+        if location is None:
+            return None
+        return self.get_repo_path(location.get("href"))
+
+    def prepare_cache_dir(self):
+        if not os.path.exists(self.cache_dir):
+            logging.debug("Creating cache directory: %s", self.cache_dir)
+            os.makedirs(self.cache_dir)
+        else:
+            # Delete old cache files from directory, keeping the cached RPMs
+            for f in os.listdir(self.cache_dir):
+                if os.path.isfile(os.path.join(self.cache_dir, f)):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+    def load_primary_db(self):
+        """
+        Download and decompress the primary_db sqlite database in the cache if the repository has one
+        """
+        self._db_tried = True
+        db_path = None
+        try:
+            db_url = self.find_primary("primary_db")
+            if db_url is None:
+                logging.debug("No primary_db in %s", self.get_repo_path(""))
+                return
+
+            # Strip the compression extension
+            db_name = db_url.rsplit("/", 1)[1]
+            (base_name, extension) = os.path.splitext(db_name)
+            if extension in [".bz2", ".xz", ".gz", ".zst"]:
+                db_name = base_name
+            db_path = os.path.join(self.cache_dir, db_name)
+
+            if os.path.exists(db_path):
+                logging.debug("Using cached primary_db: %s", db_path)
+                # Record the access for the cache eviction
+                os.utime(db_path, (time.time(), os.stat(db_path).st_mtime))
+            else:
+                self.prepare_cache_dir()
+                self.download_primary_db(db_url, extension, db_path)
+
+            # Run the query once to make sure the file is a database with the expected schema
+            (query, params) = self.get_primary_db_query("")
+            connection = sqlite3.connect(db_path)
+            try:
+                connection.execute(query + " LIMIT 1", params).fetchall()
+            finally:
+                connection.close()
+            self._db_path = db_path
+        except (OSError, EOFError, lzma.LZMAError, zlib.error, sqlite3.Error, subprocess.CalledProcessError) as error:
+            logging.warning("Error loading the primary_db, falling back to primary.xml: %s", error)
+            # Never reuse an invalid or partial database
+            if db_path is not None:
+                for path in [db_path, db_path + ".part"]:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def download_primary_db(self, db_url, extension, db_path):
+        for cnt in range(1, 4):
+            try:
+                logging.debug("Downloading primary_db %s, try %s", db_url, cnt)
+                with tempfile.NamedTemporaryFile() as tmp_file:
+                    with urllib.request.urlopen(db_url) as db_fd:
+                        shutil.copyfileobj(db_fd, tmp_file)
+                    tmp_file.flush()
+
+                    # Decompress to a partial file to never use an incomplete database
+                    part_path = db_path + ".part"
+                    openers = {".bz2": bz2.open, ".xz": lzma.open, ".gz": gzip.open}
+                    if extension in openers:
+                        with openers[extension](tmp_file.name, "rb") as input_stream:
+                            with open(part_path, "wb") as fw:
+                                shutil.copyfileobj(input_stream, fw)
+                    elif extension == ".zst":
+                        subprocess.run(
+                            ["zstd", "-d", "-q", "-f", "-o", part_path, tmp_file.name],
+                            stderr=subprocess.DEVNULL,
+                            check=True,
+                        )
+                    else:
+                        shutil.copyfile(tmp_file.name, part_path)
+                os.rename(part_path, db_path)
+                break
+            except (ConnectionResetError, ConnectionRefusedError, urllib.error.HTTPError) as e:
+                logging.debug("Connection attempt failed for URL %s with error: %s.", db_url, type(e).__name__)
+                if cnt < 3:
+                    time.sleep(2)
+                else:
+                    raise
+
+    def get_primary_db_query(self, prefix):
+        """
+        Get the query and its parameters listing the packages with a name starting with prefix
+        """
+        query = (
+            "SELECT location_href, time_file, name, epoch, version, release, rpm_header_start, rpm_header_end, pkgId "
+            "FROM packages WHERE arch IN ({})".format(", ".join(["?"] * len(ARCHS)))
+        )
+        params = list(ARCHS)
+        if prefix:
+            # Use a range rather than LIKE to benefit from the index on the name
+            query += " AND name >= ? AND name < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        return query, params
+
+    def query_primary_db(self, prefix):
+        """
+        Get the latest packages with a name starting with prefix from the primary_db
+        """
+        (query, params) = self.get_primary_db_query(prefix)
+        rpms = {}
+        connection = sqlite3.connect(self._db_path)
+        try:
+            for row in connection.execute(query, params):
+                (href, time_file, name, epoch, version, release, start, end, checksum) = row
+                header_range = (start, end) if start is not None and end is not None else None
+                rpm = obs_maven.rpm.Rpm(href, int(time_file), name, epoch, version, release, header_range, checksum)
+                latest_rpm = rpms.get(name)
+                if latest_rpm is None or latest_rpm.compare(rpm) >= 1:
+                    rpms[name] = rpm
+        finally:
+            connection.close()
+        return rpms.values()
+
+    def find_rpms(self, prefix):
+        """
+        Get the latest packages with a name starting with prefix
+        """
+        self.load_metadata()
+        if self._db_path is not None:
+            return self.query_primary_db(prefix)
+        return [rpm for rpm in self.rpms if rpm.pkgname.startswith(prefix)]
+
+    def load_metadata(self):
+        """
+        Load the primary_db or primary.xml metadata if not done yet
+        """
+        if not self._db_tried:
+            self.load_primary_db()
+        if self._db_path is None and not self._rpms:
+            self.parse_primary()
 
     def do_parse_primary(self, input_stream):
         parser = xml.sax.make_parser()
@@ -74,12 +228,14 @@ class Repo:
 
         try:
             # Check if we have this primary file cached
-            cache_file = os.path.join(self.cache_dir, primary_url.rsplit("/", 1)[1] + ".data")
+            cache_file = os.path.join(self.cache_dir, "{}.v{}.data".format(primary_url.rsplit("/", 1)[1], CACHE_VERSION))
             if os.path.exists(cache_file):
                 logging.debug("Loading RPMs from cache file: %s", cache_file)
                 with open(cache_file, "rb") as fd:
                     self._rpms = pickle.load(fd)
-                    return
+                # Record the access for the cache eviction
+                os.utime(cache_file, (time.time(), os.stat(cache_file).st_mtime))
+                return
         except OSError as error:
             logging.warning("Error loading RPMs from cache: %s", error)
 
@@ -128,13 +284,7 @@ class Repo:
 
         try:
             # Prepare cache directory
-            if not os.path.exists(self.cache_dir):
-                logging.debug("Creating cache directory: %s", self.cache_dir)
-                os.makedirs(self.cache_dir)
-            else:
-                # Delete old cache files from directory
-                for f in os.listdir(self.cache_dir):
-                    os.remove(os.path.join(self.cache_dir, f))
+            self.prepare_cache_dir()
 
             # Cache primary XML data in filesystem
             with open(cache_file, "wb") as fw:
@@ -146,7 +296,9 @@ class Repo:
     @property
     def rpms(self):
         if not self._rpms:
-            self.parse_primary()
+            self.load_metadata()
+            if self._db_path is not None:
+                self._rpms = self.query_primary_db("")
         return self._rpms
 
     def get_binary(self, path, target, mtime):
@@ -179,3 +331,52 @@ class Repo:
                     time.sleep(2)
                 else:
                     raise
+
+    def get_cached_binary(self, path, mtime):
+        """
+        Get a binary from the RPMs cache, downloading it if needed
+        """
+        rpms_dir = os.path.join(self.cache_dir, "rpms")
+        target = os.path.join(rpms_dir, os.path.basename(path))
+        if os.path.isfile(target) and int(os.stat(target).st_mtime) == mtime:
+            logging.debug("Using cached binary: %s", target)
+        else:
+            if not os.path.exists(rpms_dir):
+                os.makedirs(rpms_dir, exist_ok=True)
+            # Download to a temporary file to never expose a partial file to concurrent readers
+            (fd, part_path) = tempfile.mkstemp(dir=rpms_dir, suffix=".part")
+            os.close(fd)
+            try:
+                self.get_binary(path, part_path, mtime)
+                os.rename(part_path, target)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        # Record the access for the cache eviction
+        os.utime(target, (time.time(), mtime))
+        return target
+
+    def get_header(self, path, header_range):
+        """
+        Get only the main header bytes of an RPM using an HTTP range request
+        """
+        url = self.get_repo_path(path)
+        (start, end) = header_range
+        logging.debug("Getting header bytes %d-%d from: %s", start, end, url)
+        request = urllib.request.Request(url, headers={"Range": "bytes={}-{}".format(start, end - 1)})
+        for cnt in range(1, 4):
+            try:
+                with urllib.request.urlopen(request) as f:
+                    if f.status == 206:
+                        return f.read(end - start)
+                    # The server ignored the range: only read up to the end of the header
+                    logging.debug("Range request not honored for URL %s", url)
+                    return f.read(end)[start:]
+            except (ConnectionResetError, ConnectionRefusedError, urllib.error.HTTPError) as e:
+                logging.debug("Connection attempt failed for URL %s with error: %s.", url, type(e).__name__)
+                if cnt < 3:
+                    logging.debug("Getting header try {}".format(cnt + 1))
+                    time.sleep(2)
+                else:
+                    raise
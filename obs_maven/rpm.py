@@ -88,7 +88,7 @@ except ImportError:
 
 
 class Rpm:
-    def __init__(self, location, mtime, name, epoch, version, release):
+    def __init__(self, location, mtime, name, epoch, version, release, header_range=None, checksum=None):
         self.path = location
         self.mtime = mtime
         self.name = location[location.find("/") + 1 :]
@@ -96,6 +96,10 @@ class Rpm:
         self.epoch = epoch
         self.version = version
         self.release = release
+        # (start, end) offsets of the main header in the RPM file, as published in primary.xml
+        self.header_range = header_range
+        # Package checksum from the repository metadata, identifying its content
+        self.checksum = checksum
 
     def __str__(self):
         return "<Rpm {}: {}:{}-{}>".format(self.pkgname, self.epoch or 0, self.version, self.release)
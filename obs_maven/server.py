@@ -0,0 +1,207 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+from concurrent.futures import Future
+from datetime import datetime
+import hashlib
+import http.server
+import logging
+import os
+import os.path
+import shutil
+import socketserver
+import tempfile
+import threading
+import urllib.parse
+
+from obs_maven.artifact import Artifact, Result
+from obs_maven.pom_cache import PomCache
+import obs_maven.metadata
+
+CHECKSUMS = {".sha1": hashlib.sha1, ".md5": hashlib.md5}
+CONTENT_TYPES = {".jar": "application/java-archive", ".pom": "text/xml", ".xml": "text/xml"}
+MAVEN_METADATA = "maven-metadata.xml"
+
+
+class MavenProxy:
+    """
+    Deploy the configured artifacts in the output repository on their first request.
+
+    Concurrent requests for the same artifact share the same resolution.
+    """
+
+    def __init__(self, config, out, cache_path, parse_pom=False, header_range=False):
+        self.out = out
+        self.parse_pom = parse_pom
+        self.header_range = header_range
+        self.pom_cache = PomCache(cache_path) if parse_pom else None
+        self.artifacts = {}
+        for artifact in config.artifacts:
+            self.artifacts.setdefault(artifact.artifact, []).append(artifact)
+        self.lock = threading.Lock()
+        self.resolutions = {}
+        self.tmp = tempfile.mkdtemp(prefix="obsmvn-")
+
+    def load(self):
+        repositories = {
+            id(artifact.repository): artifact.repository
+            for artifacts in self.artifacts.values()
+            for artifact in artifacts
+        }
+        for repository in repositories.values():
+            repository.load_metadata()
+
+    def close(self):
+        shutil.rmtree(self.tmp)
+
+    def resolve(self, name):
+        """
+        Make sure the artifacts named name are deployed. Returns False for unknown artifacts.
+        """
+        artifacts = self.artifacts.get(name)
+        if not artifacts:
+            return False
+
+        with self.lock:
+            future = self.resolutions.get(name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.resolutions[name] = future
+
+        if owner:
+            tmp = tempfile.mkdtemp(dir=self.tmp)
+            try:
+                results = Artifact.process_all(
+                    artifacts, self.out, tmp, self.parse_pom, self.header_range, self.pom_cache
+                )
+                if self.pom_cache is not None:
+                    self.pom_cache.save()
+                failed = [result for result in results if result.status == Result.FAILED]
+                if failed:
+                    raise failed[0].error
+                future.set_result(True)
+            except Exception as e:
+                # Let the next request try again
+                with self.lock:
+                    del self.resolutions[name]
+                future.set_exception(e)
+            finally:
+                shutil.rmtree(tmp)
+        return future.result()
+
+    def get_metadata(self, parts):
+        """
+        Synthesize the maven-metadata.xml content from the local metadata.
+
+        The content only changes with the local metadata to keep the checksums requested separately valid.
+        """
+        local_path = os.path.join(self.out, *(parts[:-1] + [obs_maven.metadata.METADATA_FILE]))
+        versions = obs_maven.metadata.read_versions(local_path)
+        if not versions:
+            return None
+        last_updated = datetime.fromtimestamp(os.stat(local_path).st_mtime)
+        return obs_maven.metadata.render(".".join(parts[:-2]), parts[-2], versions, last_updated).encode("utf-8")
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve the files of the output repository following the maven repository layout
+    """
+
+    def do_GET(self):
+        self.serve(True)
+
+    def do_HEAD(self):
+        self.serve(False)
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+    def serve(self, with_body):
+        proxy = self.server.proxy
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        parts = [part for part in path.split("/") if part]
+        if not parts or ".." in parts:
+            self.send_error(404)
+            return
+
+        # Checksums are computed on the fly when not deployed
+        (base_name, extension) = os.path.splitext(parts[-1])
+        checksum = CHECKSUMS.get(extension)
+        if checksum is None:
+            base_name = parts[-1]
+        file_parts = parts[:-1] + [base_name]
+
+        # .../<artifact>/maven-metadata.xml or .../<artifact>/<version>/<artifact>-<version>.jar
+        artifact_index = -2 if base_name == MAVEN_METADATA else -3
+        if len(file_parts) < -artifact_index:
+            self.send_error(404)
+            return
+
+        try:
+            found = proxy.resolve(file_parts[artifact_index])
+        except Exception as e:
+            # Any failure to get the packages or their metadata means the upstream repository is the culprit
+            logging.error("Failed to resolve %s: %s" % (file_parts[artifact_index], e))
+            self.send_error(502, "Failed to resolve {}".format(file_parts[artifact_index]))
+            return
+        if not found:
+            self.send_error(404)
+            return
+
+        file_path = os.path.join(proxy.out, *parts)
+        if base_name == MAVEN_METADATA:
+            content = proxy.get_metadata(file_parts)
+        elif os.path.isfile(file_path):
+            self.send_file(file_path, with_body)
+            return
+        elif checksum is not None and os.path.isfile(os.path.join(proxy.out, *file_parts)):
+            with open(os.path.join(proxy.out, *file_parts), "rb") as fd:
+                content = fd.read()
+        else:
+            content = None
+
+        if content is None:
+            self.send_error(404)
+            return
+        if checksum is not None:
+            content = checksum(content).hexdigest().encode("utf-8")
+        self.send_content(content, CONTENT_TYPES.get(os.path.splitext(parts[-1])[1], "text/plain"), with_body)
+
+    def send_file(self, file_path, with_body):
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(file_path)[1], "text/plain"))
+        self.send_header("Content-Length", str(os.stat(file_path).st_size))
+        self.end_headers()
+        if with_body:
+            with open(file_path, "rb") as fd:
+                shutil.copyfileobj(fd, self.wfile)
+
+    def send_content(self, content, content_type, with_body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(content)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, proxy):
+        super().__init__(address, RequestHandler)
+        self.proxy = proxy
@@ -0,0 +1,117 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+import shutil
+import tempfile
+
+from obs_maven import cleanup
+from obs_maven.artifact import Artifact, Result
+from obs_maven.config import Configuration
+from obs_maven.pom_cache import PomCache
+
+
+class Session:
+    """
+    Synchronize artifacts from python code, keeping the state warm between the calls.
+
+    The configuration, the repositories metadata and the index of the deployed jars are loaded
+    once and reused by all the calls. The artifacts parameter of the methods restricts them to
+    the artifacts with these names, all the configured artifacts are used by default.
+
+    The methods don't stop on the first failing artifact: its result gets the FAILED status and
+    the exception is available in its error attribute.
+
+    Example:
+
+        session = Session("config.yaml", "repo")
+        for result in session.sync(["salt-netapi-client"]):
+            print(result.artifact.artifact, result.status, result.version)
+        session.close()
+    """
+
+    def __init__(
+        self,
+        config_path,
+        out,
+        cache_path=".obs-to-maven-cache",
+        parse_pom=False,
+        header_range=False,
+        cache_size=None,
+        allowed_artifacts=None,
+    ):
+        self.config = Configuration(config_path, out, cache_path, allowed_artifacts or [], cache_size is not None)
+        self.cache_path = cache_path
+        self.parse_pom = parse_pom
+        self.header_range = header_range
+        self.cache_size = cache_size
+        self.pom_cache = PomCache(cache_path) if parse_pom else None
+        # Jars mtimes of each output repository, see Artifact.list_jars()
+        self.index = {}
+
+    def targets(self, artifacts=None):
+        """
+        Get the (repo, artifacts) targets restricted to the artifacts names
+        """
+        return [
+            (target.repo, [artifact for artifact in target.artifacts if not artifacts or artifact.artifact in artifacts])
+            for target in self.config.targets
+        ]
+
+    def resolve(self, artifacts=None):
+        """
+        Find the package of each artifact, returning RESOLVED or FAILED results
+        """
+        results = []
+        for repo, selected in self.targets(artifacts):
+            for artifact in selected:
+                result = Result(artifact, repo, None, Result.RESOLVED)
+                try:
+                    result.rpm = artifact.get_binary()
+                except Exception as e:
+                    result.fail(e)
+                results.append(result)
+        return results
+
+    def plan(self, artifacts=None):
+        """
+        Find out which artifacts need to be deployed, returning SKIPPED, PENDING or FAILED results
+        """
+        return Artifact.plan_targets(
+            self.targets(artifacts), self.parse_pom, self.pom_cache, self.index, self.header_range
+        )
+
+    def sync(self, artifacts=None):
+        """
+        Deploy the artifacts needing it, returning SKIPPED, DEPLOYED or FAILED results
+        """
+        tmp = tempfile.mkdtemp(prefix="obsmvn-")
+        try:
+            return Artifact.process_targets(
+                self.targets(artifacts), tmp, self.parse_pom, self.header_range, self.pom_cache, self.index
+            )
+        finally:
+            shutil.rmtree(tmp)
+            if self.pom_cache is not None:
+                self.pom_cache.save()
+
+    def invalidate(self):
+        """
+        Forget the deployed jars, needed if the output repositories are changed outside of the session
+        """
+        self.index = {}
+
+    def close(self):
+        if self.cache_size is not None:
+            cleanup.evict_cache(self.cache_path, self.cache_size)
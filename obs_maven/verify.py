@@ -0,0 +1,232 @@
+# Tool creating a maven repository out of rpms built by OBS
+# Copyright (C) 2022  SUSE Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import os.path
+import pickle
+import shutil
+
+from obs_maven.artifact import Artifact
+import obs_maven.metadata
+
+MANIFEST_FILE = "verify.data"
+
+
+class Report:
+    """
+    Problems found in the maven repository
+    """
+
+    def __init__(self):
+        # Files not matching their .sha1 file
+        self.mismatches = []
+        # Jar and pom files without .sha1 file
+        self.missing_sidecars = []
+        # .sha1 files without the file they refer to
+        self.orphans = []
+        # Version folders not listed in the artifact metadata
+        self.unlisted_versions = []
+        # (metadata path, version) tuples of versions listed in the metadata, but not deployed
+        self.missing_versions = []
+        # Artifact folders without a valid metadata file
+        self.missing_metadata = []
+
+    @property
+    def problems(self):
+        return (
+            len(self.mismatches)
+            + len(self.missing_sidecars)
+            + len(self.orphans)
+            + len(self.unlisted_versions)
+            + len(self.missing_versions)
+            + len(self.missing_metadata)
+        )
+
+
+class Verifier:
+    """
+    Check the integrity of a generated maven repository, optionally repairing it.
+
+    The hashes of the files are kept in a manifest in the cache directory to avoid
+    hashing the files again if their size and mtime have not changed.
+    """
+
+    def __init__(self, repo, cache_path, jobs=None):
+        self.repo = os.path.abspath(repo)
+        self.manifest_path = os.path.join(cache_path, MANIFEST_FILE)
+        self.jobs = jobs
+
+    def load_manifest(self):
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, "rb") as fd:
+                    return pickle.load(fd)
+        except (OSError, pickle.UnpicklingError) as error:
+            logging.warning("Error loading the verify manifest: %s", error)
+        return {}
+
+    def save_manifest(self, manifest):
+        try:
+            cache_dir = os.path.dirname(self.manifest_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.manifest_path, "wb") as fd:
+                pickle.dump(manifest, fd)
+        except OSError as error:
+            logging.warning("Error saving the verify manifest: %s", error)
+
+    def compute_hashes(self, files):
+        """
+        Compute the sha1 of the (path, stat) files, reusing the manifest values for unchanged files
+        """
+        manifest = self.load_manifest()
+        hashes = {}
+        to_hash = []
+        for path, stat in files:
+            cached = manifest.get(path)
+            if cached is not None and cached[:2] == stat:
+                hashes[path] = cached
+            else:
+                to_hash.append((path, stat))
+
+        logging.debug("Hashing %d files, %d unchanged" % (len(to_hash), len(hashes)))
+        with ThreadPoolExecutor(self.jobs) as pool:
+            for (path, stat), sha1 in zip(to_hash, pool.map(Artifact.compute_sha1, [path for path, _ in to_hash])):
+                hashes[path] = stat + (sha1,)
+        return hashes
+
+    def run(self, repair=False):
+        report = Report()
+        folders = obs_maven.metadata.scan(self.repo)
+
+        # Check the files against their sha1 files
+        to_check = []
+        for path, (files, _) in folders.items():
+            for name, stat in files.items():
+                file_path = os.path.join(path, name)
+                if name.endswith(".sha1"):
+                    if name[: -len(".sha1")] not in files:
+                        report.orphans.append(file_path)
+                elif name + ".sha1" in files:
+                    to_check.append((file_path, stat))
+                elif name.endswith(".jar") or name.endswith(".pom"):
+                    report.missing_sidecars.append(file_path)
+
+        hashes = self.compute_hashes(to_check)
+        for file_path, _ in to_check:
+            with open(file_path + ".sha1", "r") as fd:
+                expected = fd.read().split()
+            if not expected or expected[0].lower() != hashes[file_path][2]:
+                report.mismatches.append(file_path)
+
+        removed = set()
+        stale_sidecars = []
+        if repair:
+            for file_path in report.missing_sidecars:
+                Artifact.compute_sha1_file(file_path)
+            for file_path in report.orphans:
+                logging.info("Removing orphan %s" % file_path)
+                os.remove(file_path)
+            for file_path in report.mismatches:
+                version_path = os.path.dirname(file_path)
+                if not Verifier.is_version_file(file_path):
+                    # Not a deployed jar or pom: its sha1 file is the stale part, updated once the metadata are fixed
+                    stale_sidecars.append(file_path)
+                elif version_path not in removed:
+                    # A corrupted version can't be fixed locally: remove it to get it deployed again
+                    logging.info("Removing corrupted version %s" % version_path)
+                    shutil.rmtree(version_path)
+                    removed.add(version_path)
+
+        # Check the metadata against the deployed versions
+        for path, (files, subdirs) in folders.items():
+            if [removed_path for removed_path in removed if Verifier.is_under(path, removed_path)]:
+                continue
+            artifact = os.path.basename(path)
+            versions = [
+                version
+                for version in obs_maven.metadata.find_versions(folders, path)
+                if os.path.join(path, version) not in removed
+            ]
+            if not versions and obs_maven.metadata.METADATA_FILE not in files:
+                continue
+
+            metadata_path = os.path.join(path, obs_maven.metadata.METADATA_FILE)
+            listed = None
+            if obs_maven.metadata.METADATA_FILE in files:
+                listed = obs_maven.metadata.read_versions(metadata_path)
+            missing = [version for version in listed or [] if version not in versions]
+            unlisted = [version for version in versions if version not in (listed or [])]
+            if listed is None:
+                if versions:
+                    report.missing_metadata.append(path)
+            else:
+                report.missing_versions.extend([(metadata_path, version) for version in missing])
+                report.unlisted_versions.extend([os.path.join(path, version) for version in unlisted])
+
+            if repair and (missing or unlisted):
+                # Keep the listed versions order and add the unlisted ones in deployment order
+                versions = [version for version in listed or [] if version in versions] + unlisted
+                if versions:
+                    logging.info("Updating %s" % metadata_path)
+                    group = obs_maven.metadata.get_group(self.repo, path)
+                    obs_maven.metadata.write(metadata_path, group, artifact, versions)
+                else:
+                    logging.info("Removing %s" % metadata_path)
+                    os.remove(metadata_path)
+
+        for file_path in stale_sidecars:
+            if os.path.exists(file_path):
+                logging.info("Updating the sha1 file of %s" % file_path)
+                Artifact.compute_sha1_file(file_path)
+
+        self.save_manifest(
+            {path: value for path, value in hashes.items() if os.path.dirname(path) not in removed}
+        )
+        Verifier.log_report(report)
+        return report
+
+    @staticmethod
+    def is_version_file(file_path):
+        """
+        Check if the file is the <artifact>-<version>.jar or .pom file of an <artifact>/<version>/ folder
+        """
+        version_path = os.path.dirname(file_path)
+        version = os.path.basename(version_path)
+        artifact = os.path.basename(os.path.dirname(version_path))
+        name = os.path.basename(file_path)
+        return obs_maven.metadata.get_version_file({name}, artifact, version) == name
+
+    @staticmethod
+    def is_under(path, parent):
+        return path == parent or path.startswith(parent + os.path.sep)
+
+    @staticmethod
+    def log_report(report):
+        for file_path in report.mismatches:
+            logging.error("Checksum mismatch: %s" % file_path)
+        for file_path in report.missing_sidecars:
+            logging.error("Missing sha1 file: %s" % file_path)
+        for file_path in report.orphans:
+            logging.error("Orphan sha1 file: %s" % file_path)
+        for version_path in report.unlisted_versions:
+            logging.error("Version missing in metadata: %s" % version_path)
+        for metadata_path, version in report.missing_versions:
+            logging.error("Version %s listed in %s is not deployed" % (version, metadata_path))
+        for path in report.missing_metadata:
+            logging.error("Missing or invalid metadata: %s" % path)
+        logging.info("Found %d problem(s)" % report.problems)